@@ -1,41 +1,108 @@
 # CircuitPython (ESP32) — Multi-session uptime with in-place updates + store-and-forward
 # https://learn.adafruit.com/adafruit-adalogger-featherwing/rtc-with-circuitpython
 
-import time, os, json, rtc, wifi, socketpool, ssl, random
+import time, os, struct, rtc, wifi, socketpool, ssl
+try:
+    import ujson as json  # MicroPython-style builds ship the C codec under this name
+except ImportError:
+    import json
+from array import array
 import board, busio, digitalio, storage
 import adafruit_ntp, adafruit_requests
 import adafruit_sdcard
 from adafruit_pcf8523.pcf8523 import PCF8523
+from secrets import secrets
 
 # ---------- UUID Generation ----------
 def generate_uuid():
-    """Generate a UUID v4-like string."""
-    # Generate 16 random bytes
-    rand_bytes = bytearray(16)
-    for i in range(16):
-        rand_bytes[i] = random.randint(0, 255)
+    """Generate a UUID v4 string."""
+    # 16 bytes from the hardware RNG
+    rand_bytes = bytearray(os.urandom(16))
     
     # Set version (4) and variant (2) bits
     rand_bytes[6] = (rand_bytes[6] & 0x0F) | 0x40  # version 4
     rand_bytes[8] = (rand_bytes[8] & 0x3F) | 0x80  # variant 2
     
     # Format as UUID string
-    uuid = "%02x%02x%02x%02x-%02x%02x-%02x%02x-%02x%02x-%02x%02x%02x%02x%02x%02x" % tuple(rand_bytes)
-    return uuid
+    h = rand_bytes.hex()
+    return f"{h[0:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:32]}"
 
 # ---------- CONFIG ----------
 # SD card pin S3 is board.D33
 # SD card pin S2 is board.D10
 SD_CS_PIN = board.D33         # SD card chip select pin (adjust for your board)
 SD_MOUNT_PATH = "/sd"           # Where to mount the SD card
-STATE_FILENAME = "sessions.json"
+SD_BAUDRATE = 1_320_000         # SD card SPI clock (the driver default); raise, e.g. to 8_000_000, if your wiring is short
+STATE_FILENAME = "sessions.bin"
+LEGACY_STATE_FILENAME = "sessions.json"  # state file of older firmware, converted once on load
 DEVICE_ID_FILENAME = "device_id.txt"
 SAVE_PERIOD_SEC = 60            # update the current session at most once/min
+SYNC_PERIOD_SEC = 600           # flush in-place slot updates to storage at most this often
 POST_PERIOD_SEC = 5             # try to POST pending sessions this often when online
+BATCH_MAX = 20                  # send at most this many sessions per batched POST
 WIFI_RECONNECT_COOLDOWN = 60    # wait this long between WiFi reconnection attempts
-MAX_SESSIONS = 200              # keep at most this many sessions (drop oldest fully-ack'd)
+MAX_IDLE_SLEEP_SEC = 5          # never sleep longer than this, so WiFi changes are noticed
+MAX_SESSIONS = 200              # ring buffer capacity (oldest fully-ack'd session is evicted first)
 WIFI_RETRIES = 15
-NTP_RETRIES = 8
+NTP_RETRIES = 6                 # retry delay starts at 0.5s and grows 1.5x (max 4s)
+NTP_TIMEOUT_SEC = 2             # per-attempt socket timeout: 6 x 2s + 6.6s of delays, ~19s worst case
+
+# ---------- STATE FILE FORMAT ----------
+# Header (ring head, count) followed by MAX_SESSIONS fixed-width slots, one per ring slot.
+# Slot: start, run_seconds, acked_run_seconds, flags, last_update (ISO strings NUL-padded).
+STATE_HEADER_FMT = "<HH"
+STATE_HEADER_SIZE = struct.calcsize(STATE_HEADER_FMT)
+SESSION_FMT = "<20sIIB20s"
+SESSION_SIZE = struct.calcsize(SESSION_FMT)
+FLAG_CLOSED = 0x01
+FLAG_STATUS_UNSENT = 0x02
+# acked_run_seconds and flags are adjacent within a slot, so an ack is patched with one write
+ACK_FMT = "<IB"
+ACK_OFFSET = struct.calcsize("<20sI")
+ACK_SIZE = struct.calcsize(ACK_FMT)
+STATE_FILE_SIZE = STATE_HEADER_SIZE + MAX_SESSIONS * SESSION_SIZE
+
+# Timing is done in integer seconds derived from time.monotonic_ns(): monotonic() returns a
+# float that allocates on every call and loses sub-second precision after a few days of uptime
+NS_PER_SEC = 1_000_000_000
+
+# Set by set_field() when a persisted field actually changes; cleared once written out
+_dirty = False
+# True while write_slots() output may still sit in filesystem caches; see maybe_sync()
+_unsynced = False
+_last_sync_t = -SYNC_PERIOD_SEC
+# Cleared if the server has no <ingest_url>/batch endpoint; we then POST one session at a time
+_batch_supported = True
+# iso_utc() result for the current monotonic second (reset whenever the clock is set)
+_iso_cache_sec = -1
+_iso_cache_str = None
+# Scratch buffer iso_utc() writes digits into (see _format_iso())
+_ISO_BUF = bytearray(b"0000-00-00T00:00:00Z")
+# The state file's image, allocated once: pack_state() and write_slots() encode into it
+# rather than building fresh bytes on every save. Free slots may hold stale records.
+_SER_BUF = bytearray(STATE_FILE_SIZE)
+_SER_VIEW = memoryview(_SER_BUF)
+# One SocketPool for the whole run, shared by NTP and HTTP (see get_pool())
+_POOL = None
+# One TLS context and one requests Session for the whole run, so HTTP keep-alive sockets are
+# reused between POSTs; the session is only rebuilt after a socket error (see _post_error())
+_SSL_CTX = ssl.create_default_context()
+_REQ_SESSION = None
+# Reusable POST bodies; adafruit_requests serializes them immediately. A batch is one
+# envelope carrying device_id once plus up to BATCH_MAX rows; the single-session fallback
+# sends _PAYLOAD. device_id is filled in once per boot by init_post().
+_ROWS = [
+    {"session_start": None, "run_seconds": 0, "last_update": None, "status": "open"}
+    for _ in range(BATCH_MAX)
+]
+_BATCH = {"device_id": None, "batch": None}
+_PAYLOAD = {"device_id": None, "session_start": None, "run_seconds": 0, "last_update": None, "status": "open"}
+# Endpoints and headers come straight from secrets.py; "access_token" is optional
+_INGEST_URL = secrets["ingest_url"]
+_BATCH_URL = _INGEST_URL + "/batch"
+_HEADERS = {"Content-Type": "application/json"}
+if secrets.get("access_token"):
+    _HEADERS["Authorization"] = "Bearer " + secrets["access_token"]
 
 # ---------- STORAGE SETUP ----------
 def init_sd_card():
@@ -43,7 +110,7 @@ def init_sd_card():
     try:
         spi = busio.SPI(board.SCK, board.MOSI, board.MISO)
         cs = digitalio.DigitalInOut(SD_CS_PIN)
-        sdcard = adafruit_sdcard.SDCard(spi, cs)
+        sdcard = adafruit_sdcard.SDCard(spi, cs, baudrate=SD_BAUDRATE)
         vfs = storage.VfsFat(sdcard)
         storage.mount(vfs, SD_MOUNT_PATH)
         print("SD card mounted at", SD_MOUNT_PATH)
@@ -75,17 +142,23 @@ def get_storage_paths(sd_path):
             except Exception as e:
                 print("Warning: Could not migrate device ID:", e)
         
-        # Migrate sessions.json from internal flash to SD card if it doesn't exist on SD
-        flash_state_path = "/" + STATE_FILENAME
-        if not file_exists(state_path) and file_exists(flash_state_path):
+        # Migrate the session file from internal flash to SD card if the SD card has none yet
+        # (either the current one or a not-yet-converted older one)
+        state_names = (STATE_FILENAME, LEGACY_STATE_FILENAME)
+        sd_has_state = any(file_exists(sd_path + "/" + name) for name in state_names)
+        flash_has_state = any(file_exists("/" + name) for name in state_names)
+        if not sd_has_state and flash_has_state:
             print("Migrating sessions from internal flash to SD card...")
             try:
-                with open(flash_state_path, "r") as f:
-                    state_data = f.read()
-                with open(state_path, "w") as f:
-                    f.write(state_data)
-                    f.flush()
-                    os.sync()
+                for name in state_names:
+                    if not file_exists("/" + name):
+                        continue
+                    with open("/" + name, "rb") as f:
+                        data = f.read()
+                    with open(sd_path + "/" + name, "wb") as f:
+                        f.write(data)
+                        f.flush()
+                        os.sync()
                 print("Session data migrated successfully")
             except Exception as e:
                 print("Warning: Could not migrate session data:", e)
@@ -144,6 +217,13 @@ def file_exists(p):
     except OSError:
         return False
 
+def set_field(col, i, value):
+    """Assign col[i] = value, marking the state dirty only if the value changed."""
+    global _dirty
+    if col[i] != value:
+        col[i] = value
+        _dirty = True
+
 def _ymdhms_from_dt(dt):
     # Handle both struct_time and tuple variants
     if hasattr(dt, "tm_year"):
@@ -151,9 +231,35 @@ def _ymdhms_from_dt(dt):
     # Common 9-tuple: (Y, M, D, H, M, S, Wd, Yd, Isdst)
     return (dt[0], dt[1], dt[2], dt[3], dt[4], dt[5])
 
+def _format_iso(y, mo, d, hh, mm, ss):
+    """YYYY-MM-DDTHH:MM:SSZ, poking ASCII digits into _ISO_BUF instead of string formatting."""
+    b = _ISO_BUF
+    b[0] = 48 + y // 1000 % 10
+    b[1] = 48 + y // 100 % 10
+    b[2] = 48 + y // 10 % 10
+    b[3] = 48 + y % 10
+    b[5] = 48 + mo // 10
+    b[6] = 48 + mo % 10
+    b[8] = 48 + d // 10
+    b[9] = 48 + d % 10
+    b[11] = 48 + hh // 10
+    b[12] = 48 + hh % 10
+    b[14] = 48 + mm // 10
+    b[15] = 48 + mm % 10
+    b[17] = 48 + ss // 10
+    b[18] = 48 + ss % 10
+    return b.decode()
+
 def iso_utc(dt=None, hw_rtc=None):
-    """Get ISO UTC timestamp. Prefers hardware RTC if available, falls back to software RTC."""
+    """Get ISO UTC timestamp. Prefers hardware RTC if available, falls back to software RTC.
+
+    Reading the clock is memoized for the current monotonic second.
+    """
+    global _iso_cache_sec, _iso_cache_str
     if dt is None:
+        now_sec = time.monotonic_ns() // NS_PER_SEC
+        if now_sec == _iso_cache_sec:
+            return _iso_cache_str
         if hw_rtc is not None:
             try:
                 dt = hw_rtc.datetime
@@ -161,34 +267,261 @@ def iso_utc(dt=None, hw_rtc=None):
                 dt = rtc.RTC().datetime
         else:
             dt = rtc.RTC().datetime
-    y, mo, d, hh, mm, ss = _ymdhms_from_dt(dt)
-    return f"{y:04d}-{mo:02d}-{d:02d}T{hh:02d}:{mm:02d}:{ss:02d}Z"
+        _iso_cache_str = _format_iso(*_ymdhms_from_dt(dt))
+        _iso_cache_sec = now_sec
+        return _iso_cache_str
+    return _format_iso(*_ymdhms_from_dt(dt))
 
-def save_json_atomic(path, obj):
+def invalidate_iso_cache():
+    global _iso_cache_sec
+    _iso_cache_sec = -1
+
+def save_bytes_atomic(path, data):
     tmp = path + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(obj, f, separators=(",", ":"))
+    with open(tmp, "wb") as f:
+        f.write(data)
         f.flush()
-        os.sync()
+    # Order matters: tmp must be durable before it replaces path, then the rename itself
+    os.sync()
     try:
-        os.remove(path)
+        os.rename(tmp, path)
     except OSError:
-        pass
-    os.rename(tmp, path)
+        # FAT refuses to rename over an existing file
+        os.remove(path)
+        os.rename(tmp, path)
+    os.sync()
+
+def _session_record(state, i):
+    """Field tuple for SESSION_FMT from ring slot i."""
+    return (state["starts"][i].encode(), state["run_seconds"][i], state["acked"][i],
+            state["flags"][i], state["last_update"][i].encode())
+
+def _set_slot(state, i, start, rs, ack, flags, last):
+    """Fill ring slot i from a SESSION_FMT record."""
+    state["starts"][i] = start.rstrip(b"\0").decode()
+    state["run_seconds"][i] = rs
+    state["acked"][i] = ack
+    state["flags"][i] = flags
+    state["last_update"][i] = last.rstrip(b"\0").decode()
+
+def pack_state(state):
+    """Encode the session ring as a header plus MAX_SESSIONS fixed-width slots into _SER_BUF."""
+    struct.pack_into(STATE_HEADER_FMT, _SER_BUF, 0, state["head"], state["count"])
+    for i in session_slots(state):
+        struct.pack_into(SESSION_FMT, _SER_BUF, STATE_HEADER_SIZE + i * SESSION_SIZE, *_session_record(state, i))
+    return _SER_BUF
+
+def unpack_state(data):
+    """Decode pack_state() output into a new session ring.
+
+    A file written with a different MAX_SESSIONS is re-packed oldest first.
+    """
+    n = (len(data) - STATE_HEADER_SIZE) // SESSION_SIZE
+    head, count = struct.unpack_from(STATE_HEADER_FMT, data, 0)
+    if n <= 0 or head >= n or count > n:
+        raise ValueError("bad state header")
+    state = new_state()
+    same = n == MAX_SESSIONS
+    if same:
+        state["head"] = head
+        state["count"] = count
+    for k in range(count):
+        j = (head + k) % n
+        i = j if same else alloc_slot(state)
+        _set_slot(state, i, *struct.unpack_from(SESSION_FMT, data, STATE_HEADER_SIZE + j * SESSION_SIZE))
+    return state
+
+def write_slots(state_path, state, slots, acked=()):
+    """Overwrite the given ring slots in place in the state file, one SESSION_SIZE record each.
+
+    Slots listed only in acked get just their acked_run_seconds and flags patched
+    (ACK_SIZE bytes). The file always holds all MAX_SESSIONS slots (see pack_state()), so a
+    minute tick or an ack touches only the sector holding that slot instead of rewriting
+    the whole file. Syncing is left to maybe_sync().
+    """
+    global _unsynced
+    with open(state_path, "r+b") as f:
+        for i in slots:
+            off = STATE_HEADER_SIZE + i * SESSION_SIZE
+            struct.pack_into(SESSION_FMT, _SER_BUF, off, *_session_record(state, i))
+            f.seek(off)
+            f.write(_SER_VIEW[off:off + SESSION_SIZE])
+        for i in acked:
+            if i in slots:
+                continue
+            off = STATE_HEADER_SIZE + i * SESSION_SIZE + ACK_OFFSET
+            struct.pack_into(ACK_FMT, _SER_BUF, off, state["acked"][i], state["flags"][i])
+            f.seek(off)
+            f.write(_SER_VIEW[off:off + ACK_SIZE])
+        f.flush()
+    _unsynced = True
+
+def maybe_sync():
+    """os.sync() pending write_slots() updates, at most once per SYNC_PERIOD_SEC.
+
+    A crash loses at most SYNC_PERIOD_SEC of run_seconds/ack progress; acks are resent.
+    """
+    global _unsynced, _last_sync_t
+    now = time.monotonic_ns() // NS_PER_SEC
+    if _unsynced and now - _last_sync_t >= SYNC_PERIOD_SEC:
+        os.sync()
+        _unsynced = False
+        _last_sync_t = now
+
+def save_state(state_path, state):
+    """Write the full state snapshot atomically."""
+    save_bytes_atomic(state_path, pack_state(state))
+
+def new_state():
+    """Empty session ring: MAX_SESSIONS preallocated slots, oldest at head.
+
+    Sessions are stored column-wise so scans run over typed arrays instead of
+    dicts: slot i is starts[i], run_seconds[i], acked[i] (the run_seconds the
+    server has confirmed), flags[i] (FLAG_* bits) and last_update[i]. starts[i]
+    is None for a free slot.
+
+    state["_pending"] lists the slots needing a POST, oldest first; it is
+    rebuilt at boot and never persisted. state["_no_clock"] lists the slots
+    started this boot before the clock was set (see fix_no_clock()).
+    """
+    return {
+        "starts": [None] * MAX_SESSIONS,
+        "run_seconds": array("I", [0] * MAX_SESSIONS),
+        "acked": array("I", [0] * MAX_SESSIONS),
+        "flags": bytearray(MAX_SESSIONS),
+        "last_update": [None] * MAX_SESSIONS,
+        "head": 0,
+        "count": 0,
+        "_pending": [],
+        "_no_clock": [],
+    }
+
+def session_slots(state):
+    """Yield occupied ring slot indices, oldest session first."""
+    head = state["head"]
+    for k in range(state["count"]):
+        yield (head + k) % MAX_SESSIONS
+
+def needs_send(state, i):
+    """True if the server has not seen slot i's latest run_seconds or its closed status."""
+    return state["run_seconds"][i] > state["acked"][i] or state["flags"][i] & FLAG_STATUS_UNSENT
+
+def is_fully_acked(state, i):
+    return state["flags"][i] & FLAG_CLOSED and not needs_send(state, i)
+
+def mark_pending(state, i):
+    pending = state["_pending"]
+    if i not in pending:
+        pending.append(i)
+
+def drop_acked_pending(state, slots):
+    """Remove those of slots the server has fully acknowledged from state["_pending"], in place."""
+    pending = state["_pending"]
+    for i in slots:
+        if i in pending and not needs_send(state, i):
+            pending.remove(i)
+
+def _drop_head(state):
+    head = state["head"]
+    state["starts"][head] = None
+    state["last_update"][head] = None
+    state["head"] = (head + 1) % MAX_SESSIONS
+    state["count"] -= 1
+
+def evict_oldest_if_acked(state):
+    """Free the oldest slot if the server already has all of it. Returns True if a slot was freed."""
+    if state["count"] == 0 or not is_fully_acked(state, state["head"]):
+        return False
+    _drop_head(state)
+    return True
+
+def alloc_slot(state):
+    """Claim the next free ring slot and return its index; the caller fills in its fields."""
+    if state["count"] == MAX_SESSIONS and not evict_oldest_if_acked(state):
+        # Nothing is safe to evict; overwrite the oldest unsent session rather than grow
+        print("Warning: session buffer full, dropping oldest unsent session:", state["starts"][state["head"]])
+        if state["head"] in state["_pending"]:
+            state["_pending"].remove(state["head"])
+        _drop_head(state)
+    idx = (state["head"] + state["count"]) % MAX_SESSIONS
+    state["count"] += 1
+    return idx
+
+def append_session(state, start):
+    """Store a new open session starting at start and return its ring slot."""
+    i = alloc_slot(state)
+    state["starts"][i] = start
+    state["run_seconds"][i] = 0
+    state["acked"][i] = 0
+    state["flags"][i] = 0
+    state["last_update"][i] = start
+    return i
+
+def fix_no_clock(state, uptime):
+    """Replace the "(unsynced)" timestamps of slots in state["_no_clock"] once the clock is set.
+
+    Their start is backdated by uptime (they began at boot) and they are resent from
+    scratch, since the server only knows them under the placeholder start.
+    Returns the slots changed.
+    """
+    slots = state["_no_clock"]
+    if not slots:
+        return slots
+    start = iso_utc(time.localtime(time.time() - uptime))
+    now_iso = iso_utc()
+    for i in slots:
+        set_field(state["starts"], i, start)
+        set_field(state["last_update"], i, now_iso)
+        set_field(state["acked"], i, 0)
+        if needs_send(state, i):
+            mark_pending(state, i)
+    state["_no_clock"] = []
+    return slots
+
+def _set_slot_from_dict(state, i, s):
+    """Fill ring slot i from a session dict as stored by older firmware."""
+    state["starts"][i] = s["start"]
+    state["run_seconds"][i] = int(s.get("run_seconds", 0))
+    state["acked"][i] = int(s.get("acked_run_seconds", 0))
+    state["flags"][i] = FLAG_CLOSED if s.get("status") == "closed" else 0
+    state["last_update"][i] = s.get("last_update") or ""
+
+def _load_legacy_state(legacy_path):
+    """Read older firmware's sessions.json (a plain list of session dicts) into a new ring."""
+    with open(legacy_path, "r") as f:
+        data = json.load(f)
+    state = new_state()
+    sess = data.get("sessions") if isinstance(data, dict) else None
+    if isinstance(sess, list):
+        for s in sess:
+            _set_slot_from_dict(state, alloc_slot(state), s)
+    return state
 
 def load_state(state_path):
-    """Load state from the specified path."""
-    if not file_exists(state_path):
-        return {"sessions": []}
+    """Load the state from the specified path, converting older firmware's sessions.json once."""
+    if file_exists(state_path):
+        try:
+            with open(state_path, "rb") as f:
+                return unpack_state(f.read())
+        except Exception as e:
+            print("Load error, starting fresh:", e)
+            return new_state()
+    legacy_path = state_path[:-len(STATE_FILENAME)] + LEGACY_STATE_FILENAME
+    if not file_exists(legacy_path):
+        return new_state()
     try:
-        with open(state_path, "r") as f:
-            data = json.load(f)
-            if "sessions" not in data or not isinstance(data["sessions"], list):
-                data["sessions"] = []
-            return data
+        state = _load_legacy_state(legacy_path)
     except Exception as e:
-        print("Load error, starting fresh:", e)
-        return {"sessions": []}
+        print("Legacy load error, starting fresh:", e)
+        return new_state()
+    # One-shot conversion to the fixed-width format
+    try:
+        save_bytes_atomic(state_path, pack_state(state))
+        os.remove(legacy_path)
+        print("Converted", legacy_path, "to", STATE_FILENAME)
+    except Exception as e:
+        print("Warning: Could not convert legacy state:", e)
+    return state
 
 def connect_wifi():
     """Connect to WiFi using environment credentials."""
@@ -207,17 +540,25 @@ def connect_wifi():
     print("Wi-Fi connection failed after", WIFI_RETRIES, "attempts")
     return False
 
-def set_time_from_ntp(hw_rtc=None):
+def get_pool():
+    """Return the shared SocketPool, creating it on first use."""
+    global _POOL
+    if _POOL is None:
+        _POOL = socketpool.SocketPool(wifi.radio)
+    return _POOL
+
+def set_time_from_ntp(hw_rtc=None, retries=NTP_RETRIES):
     """Sync time from NTP server. Updates both software and hardware RTC if available."""
-    pool = socketpool.SocketPool(wifi.radio)
+    ntp = adafruit_ntp.NTP(get_pool(), server="pool.ntp.org", tz_offset=0, socket_timeout=NTP_TIMEOUT_SEC)
     last = None
-    for i in range(NTP_RETRIES):
+    delay = 0.5
+    for i in range(retries):
         try:
-            ntp = adafruit_ntp.NTP(pool, server="pool.ntp.org", tz_offset=0)
             ntp_time = ntp.datetime
             
             # Update software RTC
             rtc.RTC().datetime = ntp_time
+            invalidate_iso_cache()
             
             # Update hardware RTC if available
             if hw_rtc is not None:
@@ -232,68 +573,129 @@ def set_time_from_ntp(hw_rtc=None):
             return True
         except Exception as e:
             last = e
-            print("NTP retry", i + 1, "/", NTP_RETRIES, "-", e)
-            time.sleep(2.0)
+            print("NTP retry", i + 1, "/", retries, "-", e)
+            if i + 1 < retries:
+                time.sleep(delay)
+                delay = min(delay * 1.5, 4.0)
     print("NTP failed:", repr(last))
     return False
 
-def prune_fully_acked(state):
-    # Keep newest MAX_SESSIONS entries; prefer to drop oldest sessions that are fully acked
-    sess = state["sessions"]
-    if len(sess) <= MAX_SESSIONS:
+# ---------- NETWORK SEND ----------
+def get_requests_session():
+    """Return the shared requests session, creating it on first use. None if that fails."""
+    global _REQ_SESSION
+    if _REQ_SESSION is None:
+        try:
+            _REQ_SESSION = adafruit_requests.Session(get_pool(), _SSL_CTX)
+        except Exception as e:
+            print("Failed to create requests session:", e)
+    return _REQ_SESSION
+
+def _post_error(e):
+    global _REQ_SESSION
+    print("POST error:", e)
+    # adafruit_requests reports repeated socket failures as OutOfRetries, not OSError
+    if isinstance(e, (OSError, adafruit_requests.OutOfRetries)):
+        # Dead socket (e.g. after a WiFi drop); start over with a fresh session next time
+        _REQ_SESSION = None
+
+def init_post(device_id):
+    _BATCH["device_id"] = device_id
+    _PAYLOAD["device_id"] = device_id
+
+def close_placeholder(state, i):
+    """Best-effort POST closing the server's "(unsynced)" row for slot i before it is renamed.
+
+    Only tried once; if it fails, that row stays open on the server.
+    """
+    req = get_requests_session()
+    if req is None:
         return
-    # Partition: keep all not-fully-acked; among fully-acked drop oldest first
-    keep = []
-    drop_candidates = []
-    for s in sess:
-        if int(s.get("acked_run_seconds", 0)) >= int(s.get("run_seconds", 0)) and s.get("status") == "closed":
-            drop_candidates.append(s)
+    payload = _fill_payload(_PAYLOAD, state, i)
+    payload["run_seconds"] = state["acked"][i]
+    payload["status"] = "closed"
+    try:
+        resp = req.post(_INGEST_URL, json=payload, headers=_HEADERS, timeout=10)
+        if 200 <= resp.status_code < 300:
+            print("POST acknowledged (placeholder session closed)")
         else:
-            keep.append(s)
-    # Drop as many from the oldest fully-acked to reach limit
-    need_to_drop = max(0, (len(keep) + len(drop_candidates)) - MAX_SESSIONS)
-    if need_to_drop > 0:
-        drop_candidates = drop_candidates[need_to_drop:]  # drop oldest ones
-    state["sessions"] = keep + drop_candidates
+            print("POST failed:", resp.status_code)
+    except Exception as e:
+        _post_error(e)
+
+def _fill_payload(payload, state, i):
+    payload["session_start"] = state["starts"][i]
+    payload["run_seconds"] = state["run_seconds"][i]
+    payload["last_update"] = state["last_update"][i]
+    payload["status"] = "closed" if state["flags"][i] & FLAG_CLOSED else "open"
+    return payload
+
+def _post_batch(req, state):
+    """POST up to BATCH_MAX pending sessions in one request.
+
+    Returns the acknowledged ring slots, or None if the server has no batch endpoint.
+    """
+    global _batch_supported
+    pending = []
+    for i in state["_pending"]:
+        if needs_send(state, i):
+            _fill_payload(_ROWS[len(pending)], state, i)
+            pending.append(i)
+            if len(pending) >= BATCH_MAX:
+                break
+    if not pending:
+        return []
+    batch = _ROWS[:len(pending)]
+    _BATCH["batch"] = batch
 
-# ---------- NETWORK SEND ----------
-def build_requests_session():
-    """Build and return a requests session, or None if it fails."""
     try:
-        pool = socketpool.SocketPool(wifi.radio)
-        ctx = ssl.create_default_context()
-        return adafruit_requests.Session(pool, ctx)
+        resp = req.post(_BATCH_URL, json=_BATCH, headers=_HEADERS, timeout=10)
     except Exception as e:
-        print("Failed to create requests session:", e)
-        return None
+        _post_error(e)
+        return []
 
-def try_post_updates(req, state, device_id, ingest_url):
-    """Send any session whose run_seconds > acked_run_seconds. Returns True if progress was made."""
-    headers = {"Content-Type": "application/json"}
-    progressed = False
-    
+    if resp.status_code in (404, 405):
+        print("Batch endpoint not available; falling back to per-session POSTs")
+        _batch_supported = False
+        return None
+    if not 200 <= resp.status_code < 300:
+        print("POST failed:", resp.status_code)
+        return []
+
+    acked, flags = state["acked"], state["flags"]
+    for i, payload in zip(pending, batch):
+        set_field(acked, i, payload["run_seconds"])
+        if payload["status"] == "closed":
+            set_field(flags, i, flags[i] & ~FLAG_STATUS_UNSENT)
+    drop_acked_pending(state, pending)
+    print("POST acknowledged (batch of", len(batch), "session(s))")
+    return pending
+
+def try_post_updates(req, state):
+    """Send any session whose run_seconds is ahead of what the server acknowledged.
+
+    Returns the ring slots the server acknowledged (empty if no progress was made).
+    """
+    if _batch_supported:
+        acked = _post_batch(req, state)
+        if acked is not None:
+            return acked
+
+    acked = []
+    flags = state["flags"]
     # Send oldest first so the server timeline is monotonic
-    for s in state["sessions"]:
-        rs = int(s.get("run_seconds", 0))
-        ack = int(s.get("acked_run_seconds", 0))
-        status = s.get("status", "open")
-        
-        if rs > ack:
-            payload = {
-                "device_id": device_id,
-                "session_start": s["start"],
-                "run_seconds": rs,
-                "last_update": s.get("last_update"),
-                "status": status,
-            }
+    for i in state["_pending"]:
+        if needs_send(state, i):
+            payload = _fill_payload(_PAYLOAD, state, i)
             
             try:
-                resp = req.post(ingest_url, json=payload, headers=headers, timeout=10)
+                resp = req.post(_INGEST_URL, json=payload, headers=_HEADERS, timeout=10)
                 
                 if 200 <= resp.status_code < 300:
-                    s["acked_run_seconds"] = rs
-                    progressed = True
-                    if status == "closed":
+                    set_field(state["acked"], i, payload["run_seconds"])
+                    acked.append(i)
+                    if payload["status"] == "closed":
+                        set_field(flags, i, flags[i] & ~FLAG_STATUS_UNSENT)
                         print("POST acknowledged (closed session)")
                     else:
                         print("POST acknowledged")
@@ -302,14 +704,16 @@ def try_post_updates(req, state, device_id, ingest_url):
                     break  # Stop on first failure to avoid hammering
                     
             except Exception as e:
-                print("POST error:", e)
+                _post_error(e)
                 break  # Stop on network error
                 
-    return progressed
+    if acked:
+        drop_acked_pending(state, acked)
+    return acked
 
 # ---------- MAIN ----------
 def main():
-    from secrets import secrets
+    global _dirty
     
     print("Boot…")
 
@@ -328,6 +732,7 @@ def main():
     if not ntp_ok and hw_rtc is not None:
         try:
             rtc.RTC().datetime = hw_rtc.datetime
+            invalidate_iso_cache()
             print("Time loaded from hardware RTC:", iso_utc(hw_rtc=hw_rtc))
             ntp_ok = True  # We have valid time from hardware RTC
         except Exception as e:
@@ -336,87 +741,113 @@ def main():
     # Get or create persistent device ID
     device_id = get_or_create_device_id(device_id_path)
     print("Device ID:", device_id)
+    init_post(device_id)
 
     # Load state and close any previously-open session
     state = load_state(state_path)
+    # In the same pass, collect the slots that still need a POST
     closed_count = 0
-    for s in state["sessions"]:
-        if s.get("status") != "closed":
-            s["status"] = "closed"
-            # Force re-send by reducing acked_run_seconds by 1
-            # This ensures the closed status gets sent to server
-            ack = int(s.get("acked_run_seconds", 0))
-            if ack > 0:
-                s["acked_run_seconds"] = ack - 1
+    pending = []
+    flags = state["flags"]
+    for i in session_slots(state):
+        if not flags[i] & FLAG_CLOSED:
+            # The server still thinks this session is open; resend it once with the new status
+            flags[i] |= FLAG_CLOSED | FLAG_STATUS_UNSENT
             closed_count += 1
+        if needs_send(state, i):
+            pending.append(i)
+    state["_pending"] = pending
     
     if closed_count > 0:
         print("Marked", closed_count, "session(s) as closed")
 
     # Start new session (one entry per boot)
-    session = {
-        "start": iso_utc(hw_rtc=hw_rtc) if ntp_ok else "(unsynced)",
-        "run_seconds": 0,
-        "acked_run_seconds": 0,
-        "last_update": iso_utc(hw_rtc=hw_rtc) if ntp_ok else "(unsynced)",
-        "status": "open"
-    }
-    state["sessions"].append(session)
-    save_json_atomic(state_path, state)
-    print("New session:", session["start"])
+    ts = iso_utc(hw_rtc=hw_rtc) if ntp_ok else "(unsynced)"
+    session_idx = append_session(state, ts)
+    if not ntp_ok:
+        state["_no_clock"].append(session_idx)
+    save_state(state_path, state)
+    _dirty = False
+    print("New session:", ts)
 
     # Initialize timing and network
-    boot_t0 = time.monotonic()
+    boot_ns = time.monotonic_ns()
     last_save_t = -9999
     last_post_t = -9999
     last_wifi_attempt = -9999
-    req = build_requests_session() if wifi.radio.ipv4_address else None
-    ingest_url = secrets["ingest_url"]
 
     while True:
-        now = time.monotonic()
-        now_int = int(now)
+        now = (time.monotonic_ns() - boot_ns) // NS_PER_SEC  # whole seconds since boot
+        changed = []  # ring slots whose run_seconds/last_update changed during this pass
+        acked = []    # ring slots whose ack counter/flags changed during this pass
 
         # Periodic session update (in-place)
-        if now_int - last_save_t >= SAVE_PERIOD_SEC:
-            last_save_t = now_int
-            elapsed = int(now - boot_t0)
-            session["run_seconds"] = elapsed
-            session["last_update"] = iso_utc(hw_rtc=hw_rtc) if ntp_ok else "(unsynced)"
-            save_json_atomic(state_path, state)
-            print("Updated:", session["start"], "run", elapsed, "s")
-
-        # Networking: reconnect if needed (with cooldown to avoid hammering)
-        if not wifi.radio.ipv4_address and (now_int - last_wifi_attempt >= WIFI_RECONNECT_COOLDOWN):
-            last_wifi_attempt = now_int
-            print("No Wi-Fi; attempting reconnection…")
-            time.sleep(2)
-            if connect_wifi():
-                print("Reconnection successful!")
-                # Try to sync time from NTP (especially if hardware RTC wasn't present at boot)
-                if set_time_from_ntp(hw_rtc):
-                    ntp_ok = True
-                req = build_requests_session()
-            else:
-                print("Reconnection failed. Will retry in", WIFI_RECONNECT_COOLDOWN, "seconds")
+        if now - last_save_t >= SAVE_PERIOD_SEC:
+            last_save_t = now
+            elapsed = now
+            set_field(state["run_seconds"], session_idx, elapsed)
+            if needs_send(state, session_idx):
+                mark_pending(state, session_idx)
+            set_field(state["last_update"], session_idx, iso_utc(hw_rtc=hw_rtc) if ntp_ok else "(unsynced)")
+            if _dirty:
+                changed.append(session_idx)
+                print("Updated:", state["starts"][session_idx], "run", elapsed, "s")
+
+        # Networking: reconnect if needed, or retry NTP while the clock was never set
+        # (with cooldown to avoid hammering)
+        if not (wifi.radio.ipv4_address and ntp_ok) and (now - last_wifi_attempt >= WIFI_RECONNECT_COOLDOWN):
+            last_wifi_attempt = now
+            online = bool(wifi.radio.ipv4_address)
+            # Already online with the clock unset: one short NTP attempt per cooldown, so a
+            # blocked NTP port cannot starve the minute ticks and POSTs
+            ntp_retries = 1
+            if not online:
+                print("No Wi-Fi; attempting reconnection…")
+                time.sleep(2)
+                online = connect_wifi()
+                if online:
+                    print("Reconnection successful!")
+                    ntp_retries = NTP_RETRIES
+                else:
+                    print("Reconnection failed. Will retry in", WIFI_RECONNECT_COOLDOWN, "seconds")
+            # Try to sync time from NTP (especially if hardware RTC wasn't present at boot)
+            if online and set_time_from_ntp(hw_rtc, ntp_retries):
+                ntp_ok = True
+                for i in state["_no_clock"]:
+                    if state["acked"][i]:
+                        close_placeholder(state, i)
+                for i in fix_no_clock(state, (time.monotonic_ns() - boot_ns) // NS_PER_SEC):
+                    print("Clock set; session start is now", state["starts"][i])
+                    if i not in changed:
+                        changed.append(i)
 
         # Try to POST pending updates
-        if wifi.radio.ipv4_address and (now_int - last_post_t >= POST_PERIOD_SEC):
-            last_post_t = now_int
-            
-            # Ensure we have a requests session
-            if req is None:
-                req = build_requests_session()
+        if wifi.radio.ipv4_address and (now - last_post_t >= POST_PERIOD_SEC):
+            last_post_t = now
             
-            # Try to send updates
+            # Try to send updates over the shared session
+            req = get_requests_session()
             if req is not None:
-                progressed = try_post_updates(req, state, device_id, ingest_url)
-                if progressed:
-                    # Persist ack counters immediately to prevent duplicate sends
-                    save_json_atomic(state_path, state)
-                    prune_fully_acked(state)
-
-        time.sleep(0.25)
+                acked = try_post_updates(req, state)
+
+        # Persist this pass's changes (including ack counters, to prevent duplicate sends).
+        # The minute tick and the ack that usually follows it share one write and one sync.
+        if _dirty:
+            write_slots(state_path, state, changed, acked)
+            _dirty = False
+        maybe_sync()
+
+        # Sleep until the next scheduled job is due instead of polling
+        next_due = last_save_t + SAVE_PERIOD_SEC
+        if wifi.radio.ipv4_address:
+            next_due = min(next_due, last_post_t + POST_PERIOD_SEC)
+        else:
+            next_due = min(next_due, last_wifi_attempt + WIFI_RECONNECT_COOLDOWN)
+        # Subtract in integer ns so only the short remaining delay becomes a float; time.sleep()
+        # takes that relative duration and idles the CPU until the next interrupt (an
+        # alarm.TimeAlarm deadline would need the float monotonic(), which coarsens with uptime)
+        delay = max(0.1, (next_due * NS_PER_SEC - (time.monotonic_ns() - boot_ns)) / NS_PER_SEC)
+        time.sleep(min(delay, MAX_IDLE_SLEEP_SEC))
 
 main()
 
@@ -7,8 +7,9 @@ import (
 	"net/http"
 )
 
-func main() {
-	http.HandleFunc("/ingest", func(w http.ResponseWriter, r *http.Request) {
+// logPost prints the request body to the console and always acks it.
+func logPost(label string) http.HandlerFunc {
+	return func(w http.ResponseWriter, r *http.Request) {
 		if r.Method != http.MethodPost {
 			http.Error(w, "Only POST allowed", http.StatusMethodNotAllowed)
 			return
@@ -22,12 +23,18 @@ func main() {
 		defer r.Body.Close()
 
 		// Print to console
-		fmt.Printf("Received POST (%d bytes): %s\n", len(body), string(body))
+		fmt.Printf("Received %s (%d bytes): %s\n", label, len(body), string(body))
 
 		// Always respond OK
 		w.WriteHeader(http.StatusOK)
 		w.Write([]byte(`{"acked":true}`))
-	})
+	}
+}
+
+func main() {
+	http.HandleFunc("/ingest", logPost("POST"))
+	// {"device_id": ..., "batch": [session update, ...]}, one row per session
+	http.HandleFunc("/ingest/batch", logPost("batch POST"))
 
 	addr := ":8080"
 	log.Println("Ingest server listening on", addr)